@@ -1,6 +1,6 @@
 import os
 from dotenv import load_dotenv
-from netdecker import decklist_parser, ocr
+from netdecker import profiling, service
 from netdecker.cardfile_data import formats
 import discord
 from dotenv import load_dotenv
@@ -11,7 +11,72 @@ logging.basicConfig(level=logging.INFO)
 load_dotenv()
 TOKEN = os.getenv('DISCORD_TOKEN')
 
+# If set, the HTTP API is served from this process as well, sharing the
+# bot's worker pool.
+HTTP_PORT = os.getenv('NETDECKER_HTTP_PORT')
+
 client = discord.Client()
+http_runner = None
+
+@client.event
+async def on_ready():
+    global http_runner
+    service.start_maintenance()
+    # on_ready fires again after every reconnect, so only start the server once.
+    if HTTP_PORT and http_runner is None:
+        from netdecker import http_server
+        http_runner = await http_server.start_site(port=int(HTTP_PORT))
+
+def is_admin(user) -> bool:
+    # Direct messages come from a plain User, which has no guild permissions.
+    permissions = getattr(user, 'guild_permissions', None)
+    return permissions is not None and permissions.administrator
+
+async def handle_profile(message: discord.Message):
+    """ Admin command for capturing parse profiles.
+
+        Usage: "!profile next [count]" captures the next parses,
+        "!profile rate fraction" captures a random sample of parses,
+        and "!profile off" stops capturing.
+    """
+    if not is_admin(message.author):
+        await message.channel.send('Only server administrators can use !profile.')
+        return
+
+    tokens = message.content.split()
+    try:
+        if len(tokens) >= 2 and tokens[1] == 'next':
+            count = int(tokens[2]) if len(tokens) >= 3 else 1
+            profiling.capture_next(count)
+            response = 'Capturing the next %d parses.' % count
+        elif len(tokens) == 3 and tokens[1] == 'rate':
+            profiling.set_sample_rate(float(tokens[2]))
+            response = 'Capturing %.1f%% of parses.' % (profiling.sample_rate * 100)
+        elif len(tokens) == 2 and tokens[1] == 'off':
+            profiling.disable()
+            response = 'Profiling disabled.'
+        else:
+            response = 'Usage: !profile next [count] | rate fraction | off'
+    except ValueError:
+        response = 'Usage: !profile next [count] | rate fraction | off'
+    await message.channel.send(response)
+
+async def handle_stats(message: discord.Message):
+    """ Admin command reporting the card matching metrics. """
+    if not is_admin(message.author):
+        await message.channel.send('Only server administrators can use !stats.')
+        return
+
+    stats = await service.stats()
+    alias = stats['alias']
+    await message.channel.send(
+        'Aliases: %d (%d canonical, %d learned). Hit rate %.1f%% over %d lookups.' %
+        (alias['aliases'], alias['canonical'], alias['learned'],
+         alias['hit_rate'] * 100, alias['lookups']))
+    confusion = stats['confusion']
+    await message.channel.send(
+        'OCR confusion keys resolved %.1f%% of %d alias misses.' %
+        (confusion['hit_rate'] * 100, confusion['lookups']))
 
 @client.event
 async def on_message(message: discord.Message):
@@ -20,22 +85,27 @@ async def on_message(message: discord.Message):
         and replies with the text decklist.
 
         Usage: Message must be a reply to a decklist image, 
-        and of the form "!decklist format".
+        and of the form "!decklist [format]". If the format is left out it's
+        detected from the cards in the decklist.
     Args:
         message (discord.Message): The discord message to be checked.
     """
     if message.author == client.user:
         return
+
+    if message.content.startswith('!profile'):
+        await handle_profile(message)
+        return
+
+    if message.content.startswith('!stats'):
+        await handle_stats(message)
+        return
     
     if message.content.startswith('!decklist'):
         logging.info("Received user command.")
         tokens = message.content.split()
-        if len(tokens) < 2:
-            response = "Please specify a format for this decklist."
-            await message.channel.send(response)
-            return
-        
-        format = tokens[1].lower()
+        # Without a format, detect it from the cards in the decklist.
+        format = tokens[1].lower() if len(tokens) >= 2 else formats.AUTO
         if not formats.validate_format(format):
             response = 'Invalid format specified. Options are %s' % formats.serialize()
             await message.channel.send(response)
@@ -47,12 +117,20 @@ async def on_message(message: discord.Message):
             return
         
         img_b64 = await message.reference.resolved.attachments[0].read()
-        response = decklist_parser.generate_decklist(img_b64, ocr.GoogleOCR(), format)
+        response = await service.generate_decklist(img_b64, format)
 
         if response.success:
             thread = await message.create_thread(name="Decklist")
             await thread.send("Identified %d maindeck cards and %d sideboard cards." % \
                               response.decklist.deck_size())
+            if format == formats.AUTO:
+                if response.decklist.format is not None:
+                    await thread.send("Detected format: %s." % response.decklist.format)
+                elif sum(response.decklist.deck_size()) > 0:
+                    await thread.send("These cards aren't all legal in any one format.")
+            if response.decklist.issues:
+                await thread.send("Possible problems with this decklist:\n" +
+                                  "\n".join("- " + issue for issue in response.decklist.issues))
             await thread.send(response.decklist.serialize())
         else:
             await message.channel.send("Invalid image url.")
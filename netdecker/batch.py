@@ -0,0 +1,277 @@
+""" Command line entry point for converting many decklist screenshots at once,
+    e.g. when building a metagame archive from a tournament.
+
+    Usage:
+        python -m netdecker.batch SOURCE [--format FORMAT] --output DIR
+
+    SOURCE is either a directory of images or a manifest file listing one
+    image path per line. Each image is written to DIR as an importable text
+    list as soon as it finishes. Progress is recorded in a journal in DIR, so
+    rerunning an interrupted batch skips the images that were already done.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
+from netdecker import decklist_parser, ocr
+from netdecker.cardfile_data import cardfile, formats
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".gif", ".bmp")
+
+JOURNAL_NAME = "progress.jsonl"
+
+
+class BatchItem:
+    """ An image to convert and the file its decklist is written to. """
+    def __init__(self, image_path: str, output_name: str):
+        self.image_path = image_path
+        self.output_name = output_name
+
+
+class BatchResult:
+    def __init__(self, item: BatchItem, success: bool, error: str = None,
+                 ocr_seconds: float = 0.0, parse_seconds: float = 0.0,
+                 decklist_text: str = None, format: str = None,
+                 format_error: str = None, issues: List[str] = None):
+        self.item = item
+        self.success = success
+        self.error = error
+        self.ocr_seconds = ocr_seconds
+        self.parse_seconds = parse_seconds
+        self.decklist_text = decklist_text
+        self.format = format
+        self.format_error = format_error
+        self.issues = issues or []
+
+    def journal_entry(self) -> dict:
+        return {
+            "image": self.item.image_path,
+            "status": "done" if self.success else "failed",
+            "output": self.item.output_name if self.success else None,
+            "error": self.error,
+            "format": self.format,
+            "format_error": self.format_error,
+            "issues": self.issues,
+            "ocr_seconds": round(self.ocr_seconds, 3),
+            "parse_seconds": round(self.parse_seconds, 3),
+        }
+
+
+def discover_images(source: str) -> List[str]:
+    """ Lists the images in a directory, or the images named in a manifest
+        file. Manifest paths are relative to the manifest's directory, and
+        blank lines and lines starting with # are ignored.
+    """
+    if os.path.isdir(source):
+        paths = [os.path.join(source, name) for name in sorted(os.listdir(source))
+                 if name.lower().endswith(IMAGE_EXTENSIONS)]
+    else:
+        base = os.path.dirname(source)
+        with open(source, "r", encoding="utf-8") as f:
+            lines = [line.strip() for line in f]
+        paths = [os.path.join(base, line) for line in lines
+                 if line and not line.startswith("#")]
+    return [os.path.abspath(path) for path in paths]
+
+
+def plan_items(image_paths: List[str]) -> List[BatchItem]:
+    """ Assigns every image a unique output file name based on its own name,
+        so the mapping is stable between an interrupted run and its resume.
+    """
+    items = []
+    used = set()
+    for path in image_paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        name = stem + ".txt"
+        suffix = 2
+        while name in used:
+            name = "%s-%d.txt" % (stem, suffix)
+            suffix += 1
+        used.add(name)
+        items.append(BatchItem(path, name))
+    return items
+
+
+def load_journal(journal_path: str) -> Dict[str, dict]:
+    """ Returns the latest journal entry for each image. A partially written
+        last line from an interrupted run is ignored.
+    """
+    entries = {}
+    if not os.path.exists(journal_path):
+        return entries
+    with open(journal_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            entries[entry["image"]] = entry
+    return entries
+
+
+def describe_missing_format(decklist) -> Optional[str]:
+    """ Explains why no format was detected for a decklist, or returns None
+        if it has one.
+    """
+    if decklist.format is not None:
+        return None
+    if sum(decklist.deck_size()) == 0:
+        return "No cards were recognized."
+    return "The cards aren't all legal in any one format."
+
+
+def parse_worker(textboxes, format: str) -> Tuple[dict, float]:
+    """ Runs in the process pool, so it has to be a top-level function.
+        Returns the fields of the BatchResult that come from the decklist.
+    """
+    start = time.perf_counter()
+    try:
+        decklist = decklist_parser.parse_textboxes(textboxes, format)
+    finally:
+        # Pool workers exit without running atexit handlers, so buffered
+        # alias hits have to be written before handing the result back.
+        cardfile.flush_alias_hits()
+    parsed = {"decklist_text": decklist.serialize(),
+              "format": decklist.format,
+              "format_error": describe_missing_format(decklist),
+              "issues": decklist.issues}
+    return parsed, time.perf_counter() - start
+
+
+def convert_image(item: BatchItem, recognizer: ocr.OCR, format: str,
+                  process_pool: ProcessPoolExecutor) -> BatchResult:
+    """ Runs the OCR for one image on the calling thread, then hands the
+        parse off to the process pool.
+    """
+    try:
+        with open(item.image_path, "rb") as f:
+            img_b64 = f.read()
+        start = time.perf_counter()
+        ocr_response = recognizer.detect_text_uri(img_b64)
+        ocr_seconds = time.perf_counter() - start
+        if not ocr_response.success:
+            return BatchResult(item, False, ocr_response.error_message or "OCR failed.",
+                               ocr_seconds=ocr_seconds)
+        parsed, parse_seconds = process_pool.submit(
+            parse_worker, ocr_response.textboxes, format).result()
+        return BatchResult(item, True, ocr_seconds=ocr_seconds,
+                           parse_seconds=parse_seconds, **parsed)
+    except Exception as e:
+        return BatchResult(item, False, "%s: %s" % (type(e).__name__, e))
+
+
+def write_output(output_dir: str, result: BatchResult):
+    """ Writes to a temporary file first so an interrupted run never leaves
+        a truncated import file behind.
+    """
+    path = os.path.join(output_dir, result.item.output_name)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(result.decklist_text)
+    os.replace(tmp_path, path)
+
+
+def run_batch(items: List[BatchItem], format: str, output_dir: str,
+              processes: int, ocr_concurrency: int,
+              recognizer: ocr.OCR = None) -> List[BatchResult]:
+    os.makedirs(output_dir, exist_ok=True)
+    journal_path = os.path.join(output_dir, JOURNAL_NAME)
+    recognizer = recognizer or ocr.GoogleOCR()
+    results = []
+
+    with ProcessPoolExecutor(max_workers=processes) as process_pool, \
+         ThreadPoolExecutor(max_workers=ocr_concurrency) as ocr_pool, \
+         open(journal_path, "a+", encoding="utf-8") as journal:
+        # Start on a fresh line if the last run was cut off mid-entry.
+        if journal.tell() > 0:
+            journal.seek(journal.tell() - 1)
+            if journal.read(1) != "\n":
+                journal.write("\n")
+        # Only submit as many images as there are OCR threads, so an
+        # interrupted run doesn't leave a queue of OCR calls behind it that
+        # would be paid for and then thrown away.
+        remaining = iter(items)
+        in_flight = {ocr_pool.submit(convert_image, item, recognizer, format, process_pool)
+                     for item in islice(remaining, ocr_concurrency)}
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if result.success:
+                    write_output(output_dir, result)
+                journal.write(json.dumps(result.journal_entry()) + "\n")
+                journal.flush()
+                os.fsync(journal.fileno())
+                results.append(result)
+                if result.success:
+                    status = "ok (%s)" % (result.format or result.format_error)
+                else:
+                    status = "failed (%s)" % result.error
+                print("[%d/%d] %s: %s" % (len(results), len(items),
+                                          os.path.basename(result.item.image_path), status))
+            in_flight |= {ocr_pool.submit(convert_image, item, recognizer, format, process_pool)
+                          for item in islice(remaining, len(done))}
+    return results
+
+
+def print_summary(results: List[BatchResult], skipped: int, elapsed: float):
+    converted = [r for r in results if r.success]
+    ocr_times = [r.ocr_seconds for r in results if r.ocr_seconds]
+    parse_times = [r.parse_seconds for r in converted]
+    print("")
+    print("Converted %d, failed %d, skipped %d (already done)."
+          % (len(converted), len(results) - len(converted), skipped))
+    if elapsed > 0:
+        print("Processed %d images in %.1fs (%.2f images/s)."
+              % (len(results), elapsed, len(results) / elapsed))
+    if ocr_times:
+        print("Mean OCR time %.2fs." % (sum(ocr_times) / len(ocr_times)))
+    if parse_times:
+        print("Mean parse time %.3fs." % (sum(parse_times) / len(parse_times)))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Convert a directory or manifest of decklist screenshots "
+                    "into importable text lists.")
+    parser.add_argument("source", help="Directory of images, or a manifest "
+                                       "file with one image path per line.")
+    parser.add_argument("-f", "--format", default=formats.AUTO,
+                        help="Constructed format, detected per image by default. "
+                             "Options are %s" % formats.serialize())
+    parser.add_argument("-o", "--output", required=True,
+                        help="Directory to write the decklists and journal to.")
+    parser.add_argument("-p", "--processes", type=int, default=os.cpu_count() or 1,
+                        help="Number of parser processes.")
+    parser.add_argument("-c", "--ocr-concurrency", type=int, default=8,
+                        help="Number of OCR requests in flight at once.")
+    parser.add_argument("--restart", action="store_true",
+                        help="Ignore the journal and convert every image again.")
+    args = parser.parse_args(argv)
+
+    if not formats.validate_format(args.format):
+        parser.error("Invalid format specified. Options are %s" % formats.serialize())
+    format = formats.parse_format(args.format)
+
+    items = plan_items(discover_images(args.source))
+    journal_path = os.path.join(args.output, JOURNAL_NAME)
+    if args.restart and os.path.exists(journal_path):
+        os.remove(journal_path)
+    journal = load_journal(journal_path)
+    pending = [item for item in items
+               if journal.get(item.image_path, {}).get("status") != "done"]
+    skipped = len(items) - len(pending)
+
+    start = time.perf_counter()
+    results = run_batch(pending, format, args.output,
+                        max(1, args.processes), max(1, args.ocr_concurrency))
+    print_summary(results, skipped, time.perf_counter() - start)
+    return 0 if all(r.success for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
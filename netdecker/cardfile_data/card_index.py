@@ -0,0 +1,252 @@
+""" In-memory indexes over the card database. Each one is loaded in bulk the
+    first time it's needed and then shared for the life of the process, so
+    post-processing steps don't pay for a query per card.
+"""
+import logging
+import re
+import sqlite3 as sl
+import threading
+from typing import Dict, Iterable, Optional
+from netdecker.cardfile_data import cardfile, formats
+
+# Characters the OCR commonly confuses, mapped to a single representative.
+# Applied after lowercasing, so "I" is covered by "i". Lines have already
+# been through preprocess_line_text, which turns a 0 or 1 inside a word into
+# o or l and drops other digits and symbols, so only letters need mapping.
+CONFUSABLE_CHARS = str.maketrans({"i": "l"})
+
+# Letter pairs the OCR reads in place of a single letter.
+CONFUSABLE_PAIRS = (("rn", "m"), ("vv", "w"))
+
+# A mana symbol at the end of a name line that the OCR read as stray
+# letters, e.g. the "U" in "Opt U". Only stripped from OCR lines, never
+# from card names, since names like "Bear Cub" end in the same letters.
+TRAILING_MANA = re.compile(r"\s+[wubrgcx]{1,3}$", re.IGNORECASE)
+
+# Used for databases built before basic lands were recorded.
+BASIC_LAND_NAMES = frozenset(
+    ["Plains", "Island", "Swamp", "Mountain", "Forest", "Wastes"] +
+    ["Snow-Covered " + land for land in
+     ("Plains", "Island", "Swamp", "Mountain", "Forest", "Wastes")])
+
+# The number of copies of a card allowed in a constructed deck, unless the
+# card says otherwise.
+DEFAULT_COPY_LIMIT = 4
+
+
+class CardMetadata:
+    """ Everything the decklist post-processing steps need to know about a
+        card, so they can run without touching the database.
+
+        Attributes:
+            name (str): The card name.
+            companion (bool): Whether the card has the companion keyword.
+            legal_mask (int): The formats the card is legal in, as bits from
+                              formats.format_bit.
+            restricted_mask (int): The formats the card is restricted in.
+            basic_land (bool): Whether the card is a basic land.
+            copy_limit (int): The copies allowed in a deck, or None if any
+                              number are allowed.
+    """
+    __slots__ = ("name", "companion", "legal_mask", "restricted_mask",
+                 "basic_land", "copy_limit")
+
+    def __init__(self, name: str, companion: bool = False, basic_land: bool = False,
+                 copy_limit: Optional[int] = DEFAULT_COPY_LIMIT) -> None:
+        self.name = name
+        self.companion = companion
+        self.legal_mask = 0
+        self.restricted_mask = 0
+        self.basic_land = basic_land
+        self.copy_limit = None if basic_land else copy_limit
+
+    def is_legal(self, format: str) -> bool:
+        return bool(self.legal_mask & formats.format_bit(format))
+
+    def max_copies(self, format: Optional[str]) -> Optional[int]:
+        """ The copies allowed in a deck of the given format, accounting for
+            restrictions. None means any number.
+        """
+        if format is not None and self.restricted_mask & formats.format_bit(format):
+            return 1
+        return self.copy_limit
+
+
+_load_lock = threading.Lock()
+_metadata: Optional[Dict[str, CardMetadata]] = None
+_legality_masks: Optional[Dict[str, int]] = None
+_format_sizes: Optional[Dict[str, int]] = None
+_confusion_indexes: Dict[Optional[str], Dict[str, Optional[str]]] = {}
+_stats_lock = threading.Lock()
+_confusion_lookups = 0
+_confusion_hits = 0
+
+
+def _load_metadata():
+    """ Reads every card and legality in two queries. The basic land, copy
+        limit and restricted columns are optional so older databases still
+        load, falling back to BASIC_LAND_NAMES and DEFAULT_COPY_LIMIT.
+    """
+    global _metadata, _legality_masks, _format_sizes
+    with _load_lock:
+        if _metadata is not None:
+            return
+        con = sl.connect(cardfile.DATABASE_PATH)
+        cur = con.cursor()
+        with con:
+            object_columns = cardfile.table_columns(cur, "CARD_OBJECT")
+            has_limits = "basic_land" in object_columns and "copy_limit" in object_columns
+            if has_limits:
+                cur.execute("SELECT NAME, COMPANION, BASIC_LAND, COPY_LIMIT FROM CARD_OBJECT")
+                cards = cur.fetchall()
+            else:
+                cur.execute("SELECT NAME, COMPANION FROM CARD_OBJECT")
+                cards = [(name, companion, name in BASIC_LAND_NAMES, DEFAULT_COPY_LIMIT)
+                         for name, companion in cur.fetchall()]
+
+            if "restricted" in cardfile.table_columns(cur, "CARD_LEGALITIES"):
+                cur.execute("SELECT NAME, FORMAT, RESTRICTED FROM CARD_LEGALITIES")
+                legalities = cur.fetchall()
+            else:
+                logging.warning("The card database has no restricted column, so "
+                                "restricted cards won't be checked. Rebuild it "
+                                "with database_setup to enable the check.")
+                cur.execute("SELECT NAME, FORMAT FROM CARD_LEGALITIES")
+                legalities = [(name, format, 0) for name, format in cur.fetchall()]
+
+        metadata = {}
+        for name, companion, basic_land, copy_limit in cards:
+            card = metadata.get(name)
+            if card is None:
+                metadata[name] = CardMetadata(name, companion == 1, bool(basic_land), copy_limit)
+            else:
+                # Distinct cards can share a front face name.
+                card.companion = card.companion or companion == 1
+
+        sizes = dict.fromkeys(formats.supported_formats, 0)
+        for name, format, restricted in legalities:
+            if format not in sizes:
+                continue
+            card = metadata.setdefault(name, CardMetadata(name))
+            bit = formats.format_bit(format)
+            if not card.legal_mask & bit:
+                sizes[format] += 1
+            card.legal_mask |= bit
+            if restricted:
+                card.restricted_mask |= bit
+
+        _format_sizes = sizes
+        _legality_masks = {name: card.legal_mask for name, card in metadata.items()
+                           if card.legal_mask}
+        _metadata = metadata
+
+
+def card_metadata(name: str) -> Optional[CardMetadata]:
+    """ Returns the cached metadata for a card, or None for unknown names. """
+    if _metadata is None:
+        _load_metadata()
+    return _metadata.get(name)
+
+
+def legality_masks() -> Dict[str, int]:
+    """ Maps every card name to a bitmask of the formats it's legal in,
+        using the bits from formats.format_bit.
+    """
+    if _legality_masks is None:
+        _load_metadata()
+    return _legality_masks
+
+
+def format_sizes() -> Dict[str, int]:
+    """ Maps every supported format to the number of cards legal in it. """
+    if _format_sizes is None:
+        _load_metadata()
+    return _format_sizes
+
+
+def narrowest_format(card_names: Iterable[str]) -> Optional[str]:
+    """ Finds the format with the smallest card pool in which every one of
+        the given cards is legal.
+
+    Returns:
+        The format name, or None if there are no cards or no single format
+        contains all of them.
+    """
+    card_names = list(card_names)
+    if len(card_names) == 0:
+        return None
+    masks = legality_masks()
+    common = None
+    for name in card_names:
+        mask = masks.get(name, 0)
+        common = mask if common is None else common & mask
+        if common == 0:
+            return None
+    if not common:
+        return None
+    sizes = format_sizes()
+    return min(formats.formats_in_mask(common), key=lambda f: sizes[f])
+
+
+def canonical_key(text: str) -> str:
+    """ Collapses the characters the OCR tends to confuse, so a misread
+        line has the same key as the card name it was read from.
+    """
+    key = text.lower().strip()
+    for pair, replacement in CONFUSABLE_PAIRS:
+        key = key.replace(pair, replacement)
+    key = key.translate(CONFUSABLE_CHARS)
+    # Spacing and punctuation are dropped entirely since the OCR often
+    # merges words or loses commas and apostrophes.
+    return "".join(c for c in key if c.isalnum())
+
+
+def confusion_index(format: Optional[str]) -> Dict[str, Optional[str]]:
+    """ Maps the canonical key of every card name in a format (or in every
+        format, if format is None) to that card name. Keys shared by more
+        than one card map to None, since they can't be resolved this way.
+    """
+    index = _confusion_indexes.get(format)
+    if index is not None:
+        return index
+    bit = formats.format_bit(format) if format is not None else None
+    index = {}
+    for name, mask in legality_masks().items():
+        if bit is not None and not mask & bit:
+            continue
+        key = canonical_key(name)
+        index[key] = name if index.get(key, name) == name else None
+    return _confusion_indexes.setdefault(format, index)
+
+
+def confusion_match(line: str, format: Optional[str]) -> Optional[str]:
+    """ Resolves a line to a card name with a lookup of its canonical key
+        (one more per trailing mana symbol), or returns None if there's no
+        unambiguous match.
+    """
+    global _confusion_lookups, _confusion_hits
+    index = confusion_index(format)
+    line = line.strip()
+    # Try the whole line first, then peel off one trailing mana symbol at a
+    # time, so a name that really ends in something like "Cub" still matches.
+    while True:
+        name = index.get(canonical_key(line))
+        stripped = TRAILING_MANA.sub("", line)
+        if name is not None or stripped == line:
+            break
+        line = stripped
+    with _stats_lock:
+        _confusion_lookups += 1
+        if name is not None:
+            _confusion_hits += 1
+    return name
+
+
+def confusion_stats() -> dict:
+    """ Reports how often lines that missed the alias table were resolved by
+        their canonical key in this process.
+    """
+    return {
+        "lookups": _confusion_lookups,
+        "hit_rate": _confusion_hits / _confusion_lookups if _confusion_lookups else 0.0,
+    }
@@ -1,45 +1,176 @@
 from os import name
 import sqlite3 as sl
+import atexit
+import threading
+import time
 import pkg_resources
 
 DATABASE_PATH = pkg_resources.resource_filename(__name__, "cards.db")
 
-def is_companion(card_name):
+# Alias hits are counted in memory and written back in batches, so a lookup
+# doesn't have to write to the database. This is the number of distinct
+# aliases buffered before a flush.
+HIT_FLUSH_THRESHOLD = 200
+
+# Whether lookups update alias usage and new aliases are saved. Turned off
+# to rerun a parse without changing the database, e.g. profile replays.
+learning = True
+
+_alias_lock = threading.Lock()
+_schema_checked = set()
+_pending_hits = {}
+_alias_lookups = 0
+_alias_hits = 0
+
+def table_columns(cur, table):
+    cur.execute("PRAGMA table_info(%s)" % table)
+    return [row[1].lower() for row in cur.fetchall()]
+
+def ensure_alias_schema():
+    """ Upgrades a CARD_ALIAS table from before hit tracking, adding the
+        usage columns and the index used by name_from_alias. Only checks
+        each database once per process.
+    """
+    if DATABASE_PATH in _schema_checked:
+        return
+    with _alias_lock:
+        if DATABASE_PATH in _schema_checked:
+            return
+        con = sl.connect(DATABASE_PATH)
+        cur = con.cursor()
+        with con:
+            columns = table_columns(cur, "CARD_ALIAS")
+            if "hits" not in columns:
+                cur.execute("ALTER TABLE CARD_ALIAS ADD COLUMN hits INTEGER NOT NULL DEFAULT 0")
+            if "last_used" not in columns:
+                cur.execute("ALTER TABLE CARD_ALIAS ADD COLUMN last_used REAL")
+            cur.execute("CREATE INDEX IF NOT EXISTS CARD_ALIAS_LOWER ON CARD_ALIAS(LOWER(alias))")
+            _schema_checked.add(DATABASE_PATH)
+
+def _record_lookup(alias):
+    """ Counts an alias lookup, and a hit if an alias was found. """
+    global _alias_lookups, _alias_hits
+    if not learning:
+        return
+    flush = False
+    with _alias_lock:
+        _alias_lookups += 1
+        if alias is not None:
+            _alias_hits += 1
+            count, _ = _pending_hits.get(alias, (0, None))
+            _pending_hits[alias] = (count + 1, time.time())
+            flush = len(_pending_hits) >= HIT_FLUSH_THRESHOLD
+    if flush:
+        flush_alias_hits()
+
+def flush_alias_hits():
+    """ Writes the buffered alias hit counts to the database. """
+    with _alias_lock:
+        if not _pending_hits:
+            return
+        updates = [(count, last_used, alias)
+                   for alias, (count, last_used) in _pending_hits.items()]
+        _pending_hits.clear()
     con = sl.connect(DATABASE_PATH)
-    cur = con.cursor()
     with con:
-        cur.execute("SELECT COMPANION FROM CARD_OBJECT WHERE NAME = ?", [card_name])
-        num = cur.fetchone()
-    return num is not None and num[0] == 1
+        con.executemany("UPDATE CARD_ALIAS SET hits = hits + ?, last_used = MAX(COALESCE(last_used, 0), ?) WHERE alias = ?", updates)
+
+atexit.register(flush_alias_hits)
 
 def name_from_alias(alias, format, is_truncated):
     """ Checks the alias table to find a match for the provided alias.
 
     Args:
         alias (str): The input alias string.
-        format ([type]): The constructed format the alias is from.
+        format (str): The constructed format the alias is from, or None to
+                      match against cards from every format.
         is_truncated (bool): Flag for whether the alias is truncated (...)
 
     Returns:
         The card name associated with that alias, or None if no such name exists.
     """
+    ensure_alias_schema()
+    # Truncated aliases are matched as a range on the lowercase alias rather
+    # than with SUBSTR, so that both lookups can use the CARD_ALIAS_LOWER index.
+    if is_truncated:
+        condition = "LOWER(ALIAS) >= ? AND LOWER(ALIAS) < ?"
+        params = [alias.lower(), alias.lower() + "\U0010ffff"]
+    else:
+        condition = "LOWER(ALIAS) = ?"
+        params = [alias.lower()]
+
     con = sl.connect(DATABASE_PATH)
     cur = con.cursor()
     with con:
-        if is_truncated:
-            cur.execute("SELECT NAME FROM CARD_ALIAS NATURAL JOIN CARD_LEGALITIES WHERE FORMAT = ? AND SUBSTR(LOWER(ALIAS), 1, ?) = ?", [format, len(alias), alias.lower()])
+        if format is None:
+            cur.execute("SELECT ALIAS, NAME FROM CARD_ALIAS WHERE " + condition, params)
         else:
-            cur.execute("SELECT NAME FROM CARD_ALIAS NATURAL JOIN CARD_LEGALITIES WHERE FORMAT = ? AND LOWER(ALIAS) = ?", [format, alias.lower()])
+            cur.execute("SELECT ALIAS, NAME FROM CARD_ALIAS NATURAL JOIN CARD_LEGALITIES WHERE FORMAT = ? AND " + condition, [format] + params)
         result = cur.fetchone()
+    _record_lookup(result[0] if result else None)
     if not result:
         return None
     else:
-        return result[0]
+        return result[1]
 
 def add_alias(alias: str, card_name: str):
+    """ Saves a learned alias. The fuzzy match that found it counts as its
+        first hit, so new aliases aren't the first to go in compaction.
+    """
+    if not learning:
+        return
+    ensure_alias_schema()
+    con = sl.connect(DATABASE_PATH)
+    with con:
+        con.execute("INSERT OR IGNORE INTO CARD_ALIAS (alias, name, hits, last_used) VALUES (?, ?, 1, ?)", (alias, card_name, time.time()))
+
+def compact_aliases(max_learned: int) -> int:
+    """ Evicts the least valuable learned aliases until at most max_learned
+        are left. Canonical aliases (where the alias is the card name itself)
+        are never evicted. An alias's value is its hit count, discounted by
+        the number of days since it was last used.
+
+    Args:
+        max_learned (int): The number of learned aliases to keep.
+
+    Returns:
+        int: The number of aliases evicted.
+    """
+    ensure_alias_schema()
+    flush_alias_hits()
+    con = sl.connect(DATABASE_PATH)
+    cur = con.cursor()
+    with con:
+        cur.execute("SELECT COUNT(*) FROM CARD_ALIAS WHERE alias != name")
+        excess = cur.fetchone()[0] - max_learned
+        if excess <= 0:
+            return 0
+        cur.execute("""
+            DELETE FROM CARD_ALIAS WHERE alias IN (
+                SELECT alias FROM CARD_ALIAS WHERE alias != name
+                ORDER BY hits / (1.0 + (? - COALESCE(last_used, 0)) / 86400.0), last_used
+                LIMIT ?
+            )""", (time.time(), excess))
+    return excess
+
+def alias_stats() -> dict:
+    """ Reports the size of the alias table, and the fraction of alias
+        lookups in this process that found a match.
+    """
+    ensure_alias_schema()
     con = sl.connect(DATABASE_PATH)
+    cur = con.cursor()
     with con:
-        con.execute("INSERT OR IGNORE INTO CARD_ALIAS VALUES (?, ?)", (alias, card_name))
+        cur.execute("SELECT COUNT(*), SUM(alias = name) FROM CARD_ALIAS")
+        total, canonical = cur.fetchone()
+    canonical = canonical or 0
+    return {
+        "aliases": total,
+        "canonical": canonical,
+        "learned": total - canonical,
+        "lookups": _alias_lookups,
+        "hit_rate": _alias_hits / _alias_lookups if _alias_lookups else 0.0,
+    }
 
 def names_in_range(min_length, max_length, format):
     """ Returns all the card names in a given length range.
@@ -47,7 +178,8 @@ def names_in_range(min_length, max_length, format):
     Args:
         min_length (int): Lower bound on card length, inclusive
         max_length (int): Upper bound on card length, inclusive
-        format (str): The constructed format to pull cards from.
+        format (str): The constructed format to pull cards from, or None to
+                      pull cards from every format.
 
     Returns:
         List[str]: The card names that match the input criteria.
@@ -55,7 +187,9 @@ def names_in_range(min_length, max_length, format):
     con = sl.connect(DATABASE_PATH)
     cur = con.cursor()
     with con:
-
-        cur.execute("SELECT NAME FROM CARD_OBJECT NATURAL JOIN CARD_LEGALITIES WHERE FORMAT = ? AND LENGTH(NAME) BETWEEN ? AND ? ", (format, min_length, max_length))
+        if format is None:
+            cur.execute("SELECT DISTINCT NAME FROM CARD_OBJECT WHERE LENGTH(NAME) BETWEEN ? AND ? ", (min_length, max_length))
+        else:
+            cur.execute("SELECT NAME FROM CARD_OBJECT NATURAL JOIN CARD_LEGALITIES WHERE FORMAT = ? AND LENGTH(NAME) BETWEEN ? AND ? ", (format, min_length, max_length))
         result = cur.fetchall()
     return [tup[0] for tup in result]
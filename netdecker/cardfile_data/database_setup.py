@@ -1,7 +1,29 @@
+import re
 import requests
 import sqlite3 as sl
 import formats
 
+COPY_LIMIT_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10
+}
+
+def copy_limit(card):
+    """ The number of copies allowed in a deck, or None if there's no limit.
+        Basic lands and a handful of cards like Relentless Rats override the
+        usual limit of four in their type line or rules text.
+    """
+    if "Basic" in card.get("type_line", ""):
+        return None
+    oracle_text = card.get("oracle_text") or " ".join(
+        face.get("oracle_text", "") for face in card.get("card_faces", []))
+    if "A deck can have any number of cards named" in oracle_text:
+        return None
+    match = re.search(r"A deck can have up to (\w+) cards named", oracle_text)
+    if match and match.group(1) in COPY_LIMIT_WORDS:
+        return COPY_LIMIT_WORDS[match.group(1)]
+    return 4
+
 def generate_card_records():
     scryfall_url = "https://data.scryfall.io/oracle-cards/oracle-cards-20250217100208.json"
     card_dict = requests.get(scryfall_url).json()
@@ -14,12 +36,13 @@ def generate_card_records():
         legal_formats = []
         for f in formats.supported_formats:
             if card["legalities"][f] in ("legal", "restricted"):
-                legal_formats.append((name, f))
+                legal_formats.append((name, f, card["legalities"][f] == "restricted"))
         if len(legal_formats) == 0:
             continue
         
         is_companion = "Companion" in card["keywords"]
-        card_objects.append((card["id"], name, is_companion))
+        is_basic = "Basic" in card.get("type_line", "")
+        card_objects.append((card["id"], name, is_companion, is_basic, copy_limit(card)))
         card_legalities.extend(legal_formats)
     
     return card_objects, card_legalities
@@ -34,7 +57,9 @@ with con:
         CREATE TABLE CARD_OBJECT (
             scryfall_id TEXT PRIMARY KEY,
             name TEXT,
-            companion INTEGER
+            companion INTEGER,
+            basic_land INTEGER,
+            copy_limit INTEGER
         );
     """)
 
@@ -42,9 +67,12 @@ with con:
     con.execute("""        
         CREATE TABLE IF NOT EXISTS CARD_ALIAS (
             alias TEXT PRIMARY KEY,
-            name TEXT NOT NULL
+            name TEXT NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0,
+            last_used REAL
         );
     """)
+    con.execute("CREATE INDEX CARD_ALIAS_LOWER ON CARD_ALIAS(LOWER(alias));")
 
     con.execute("DROP TABLE IF EXISTS CARD_LEGALITIES;")
 
@@ -52,15 +80,16 @@ with con:
         CREATE TABLE IF NOT EXISTS CARD_LEGALITIES (
             name TEXT NOT NULL,
             format TEXT NOT NULL,
+            restricted INTEGER NOT NULL DEFAULT 0,
             UNIQUE(name, format)
         );
     """)
 
-    con.executemany("INSERT INTO CARD_OBJECT VALUES (?, ?, ?)", card_objects)
+    con.executemany("INSERT INTO CARD_OBJECT VALUES (?, ?, ?, ?, ?)", card_objects)
 
-    con.executemany("INSERT INTO CARD_LEGALITIES VALUES (?, ?)", card_legalities)
+    con.executemany("INSERT INTO CARD_LEGALITIES VALUES (?, ?, ?)", card_legalities)
 
-    con.execute("""INSERT INTO CARD_ALIAS SELECT name, name FROM CARD_OBJECT""")
+    con.execute("""INSERT OR IGNORE INTO CARD_ALIAS (alias, name) SELECT name, name FROM CARD_OBJECT""")
 
 
 
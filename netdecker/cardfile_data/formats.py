@@ -5,6 +5,9 @@ supported_formats = [
     "legacy", "vintage", "pauper"
 ]
 
+# Pseudo-format for decklists whose format should be detected from the cards.
+AUTO = "auto"
+
 def get_cardlist(input: str) -> Optional[str]:
     format = input.lower().strip()
     if format not in supported_formats:
@@ -16,7 +19,14 @@ def parse_format(input: str) -> str:
     return input.lower().strip()
 
 def validate_format(input: str) -> bool:
-    return parse_format(input) in supported_formats
+    return parse_format(input) in supported_formats or parse_format(input) == AUTO
+
+def format_bit(format: str) -> int:
+    """ The bit representing a format in a card's legality bitmask. """
+    return 1 << supported_formats.index(format)
+
+def formats_in_mask(mask: int) -> List[str]:
+    return [f for f in supported_formats if mask & format_bit(f)]
 
 def serialize() -> List[str]:
-    return ", ".join(supported_formats)
+    return ", ".join(supported_formats + [AUTO])
@@ -4,9 +4,10 @@ import Levenshtein
 from netdecker.text_storage import Textbox
 from netdecker.decklist_storage import Decklist, DecklistResponse, CardQuantity, CardTuple
 from netdecker.ocr import OCR
+from netdecker import profiling
 from typing import List
 import logging
-from netdecker.cardfile_data import cardfile
+from netdecker.cardfile_data import card_index, cardfile, formats
 
 # The threshold for determining the maximum allowed distance when matching
 # an input string to a card name. A value of N represents a tolerance of one
@@ -28,12 +29,18 @@ class DecklistParser:
         with an input set of textboxes from the OCR, then parses the card names
         and card quantities from those input strings and packages them into
         a Decklist object.
+
+        If the format is formats.AUTO, lines are matched against the cards
+        from every format at once, and the format is picked afterwards from
+        the legalities of the cards that were found.
     """
     def __init__(self, textboxes: List[Textbox], format: str):
         self.textboxes = textboxes
         self.decklist = Decklist()
         self.quantities = []
         self.format = format
+        # The format to restrict card matching to, None for every format.
+        self.match_format = None if format == formats.AUTO else format
     
     def preprocess_line_text(self, line):
         """ Some preprocessing on a raw text line to strip whitespace and any
@@ -45,6 +52,11 @@ class DecklistParser:
         if match:
             return match.group(0)
 
+        # A 0 or 1 between two letters is almost always a misread O or l,
+        # so fix those up rather than dropping them with the other digits.
+        line = re.sub("(?<=[a-zA-Z])0(?=[a-zA-Z])", "o", line)
+        line = re.sub("(?<=[a-zA-Z])1(?=[a-zA-Z])", "l", line)
+
         # strip out all characters that can't appear in a card nae.
         allowed_chars = string.ascii_letters + ' ' + ',' + '\'' + '-' + '.'
         line = ''.join([c for c in line if c in allowed_chars])
@@ -76,21 +88,30 @@ class DecklistParser:
         line, is_truncated = self.truncation_check(line)
 
         # try to get an exact match with the card name
-        exact_match = cardfile.name_from_alias(line, self.format, is_truncated)
+        exact_match = cardfile.name_from_alias(line, self.match_format, is_truncated)
         if exact_match is not None:
             return exact_match
+
+        # Next try a single hash lookup that forgives the usual OCR confusions
+        # (rn/m, l/I, curly apostrophes, stray mana symbols and so on). This
+        # only works on whole names, so truncated lines skip it.
+        if not is_truncated:
+            confusion_match = card_index.confusion_match(line, self.match_format)
+            if confusion_match is not None:
+                cardfile.add_alias(line, confusion_match)
+                return confusion_match
         
         # if that fails, iterate through all cards with a similar length name
         # and try to find a strong partial match.
         if is_truncated:
             # The truncated line will be at least 3 characters shorter
             # than the non-truncated card name.
-            candidates = cardfile.names_in_range(len(line) + 3, MAX_CARD_LENGTH, self.format)
+            candidates = cardfile.names_in_range(len(line) + 3, MAX_CARD_LENGTH, self.match_format)
         else:
             # The OCR will almost never produce a name shorter than the
             # length of the actual card name, but it often produces a longer
             # one by incorrectly interpreting the mana cost.
-            candidates = cardfile.names_in_range(len(line) - 3, len(line) + 1, self.format)
+            candidates = cardfile.names_in_range(len(line) - 3, len(line) + 1, self.match_format)
         
         # Iterate through all the candidates and try to find one within
         # the distance threshold.
@@ -149,20 +170,46 @@ class DecklistParser:
         self.decklist.cull_outliers()  
         self.decklist.match_quantities(self.quantities)
         self.decklist.companion_check()
+        self.detect_format()
+        self.decklist.validate()
+
+    def detect_format(self):
+        """ Records the decklist's format. In auto mode this is the narrowest
+            format the whole deck is legal in, or None if there isn't one.
+        """
+        if self.match_format is not None:
+            self.decklist.format = self.format
+            return
+        names = [card.name for card in self.decklist.maindeck + self.decklist.sideboard]
+        if self.decklist.companion is not None:
+            names.append(self.decklist.companion.name)
+        self.decklist.format = card_index.narrowest_format(names)
     
+def parse_textboxes(textboxes: List[Textbox], format: str) -> Decklist:
+    """ Runs the parser over textboxes that have already been through the
+        OCR and returns the populated decklist.
+    """
+    if profiling.active:
+        return profiling.profile_parse(_parse_textboxes, textboxes, format)
+    return _parse_textboxes(textboxes, format)
+
+def _parse_textboxes(textboxes: List[Textbox], format: str) -> Decklist:
+    parser = DecklistParser(textboxes, format)
+    parser.create_decklist()
+    return parser.decklist
+
 def generate_decklist(img_b64, recognizer: OCR, format: str):
     """ The actual payoff function to be called externally. Invokes the
         recognizer, creates a decklist parser to handle the payoff, then creates
         and returns a decklist response.
     """
     ocr_response = recognizer.detect_text_uri(img_b64)
-    decklist_response = DecklistResponse(ocr_response.success)
+    decklist_response = DecklistResponse(ocr_response.success,
+                                         error_message=ocr_response.error_message)
 
     # If the OCR was unsuccessful we can skip straight to the response.
     if not decklist_response.success:
         return decklist_response
     else:
-        parser = DecklistParser(ocr_response.textboxes, format)
-        parser.create_decklist()
-        decklist_response.decklist = parser.decklist
+        decklist_response.decklist = parse_textboxes(ocr_response.textboxes, format)
         return decklist_response
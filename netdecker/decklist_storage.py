@@ -1,6 +1,10 @@
 from netdecker.text_storage import BoundingBox, Vertex
 from typing import List
-from netdecker.cardfile_data import cardfile
+from netdecker.cardfile_data import card_index
+
+# Deck construction rules shared by every supported constructed format.
+MIN_MAINDECK_SIZE = 60
+MAX_SIDEBOARD_SIZE = 15
 
 # The minimum height needed to be classified as a card, as a fraction of
 # the average height among all potential cards.
@@ -24,6 +28,9 @@ class CardTuple:
     def serialize(self) -> str:
         return "%d %s\n" % (self.quantity, self.name)
 
+    def to_dict(self) -> dict:
+        return {"name": self.name, "quantity": self.quantity}
+
 
 class Decklist:
     """ Class for storing a parsed decklist. Stores cards in the maindeck,
@@ -36,6 +43,8 @@ class Decklist:
         self.sideboard : List[CardTuple] = []
         self.sideboard_position : Vertex = None
         self.companion : CardTuple = None
+        self.format : str = None
+        self.issues : List[str] = []
 
     def add_card(self, card: CardTuple):
         def add_or_increment(card_list: List[CardTuple], card: CardTuple):
@@ -73,7 +82,8 @@ class Decklist:
         if maindeck_first.quantity != 1 or sideboard_first.quantity != 1:
             return
         
-        if cardfile.is_companion(maindeck_first.name):
+        metadata = card_index.card_metadata(maindeck_first.name)
+        if metadata is not None and metadata.companion:
             self.companion = CardTuple(maindeck_first.name, None, 1)
             self.maindeck = self.maindeck[1:]
             self.sideboard = self.sideboard[1:]
@@ -138,12 +148,58 @@ class Decklist:
         
         return output
 
+    def validate(self):
+        """ Checks the decklist against the deck construction rules of its
+            format: card legality, copy limits, and deck and sideboard size.
+            Uses the cached card metadata, so it doesn't touch the database.
+            Any problems found are stored as messages in self.issues.
+        """
+        self.issues = []
+        sideboard = list(self.sideboard)
+        if self.companion is not None:
+            sideboard.append(self.companion)
+
+        copies = {}
+        for card in self.maindeck + sideboard:
+            copies[card.name] = copies.get(card.name, 0) + card.quantity
+
+        for name, count in copies.items():
+            metadata = card_index.card_metadata(name)
+            if metadata is None:
+                continue
+            if self.format is not None and not metadata.is_legal(self.format):
+                self.issues.append("%s is not legal in %s." % (name, self.format))
+            limit = metadata.max_copies(self.format)
+            if limit is not None and count > limit:
+                self.issues.append("%s has %d copies, the limit is %d."
+                                   % (name, count, limit))
+
+        maindeck_count = sum(card.quantity for card in self.maindeck)
+        sideboard_count = sum(card.quantity for card in sideboard)
+        if maindeck_count < MIN_MAINDECK_SIZE:
+            self.issues.append("Maindeck has %d cards, the minimum is %d."
+                               % (maindeck_count, MIN_MAINDECK_SIZE))
+        if sideboard_count > MAX_SIDEBOARD_SIZE:
+            self.issues.append("Sideboard has %d cards, the maximum is %d."
+                               % (sideboard_count, MAX_SIDEBOARD_SIZE))
+
+    def to_dict(self) -> dict:
+        return {
+            "format": self.format,
+            "issues": self.issues,
+            "companion": self.companion.to_dict() if self.companion else None,
+            "maindeck": [card.to_dict() for card in self.maindeck],
+            "sideboard": [card.to_dict() for card in self.sideboard],
+        }
+
     def deck_size(self):
         maindeck_count = sum([card.quantity for card in self.maindeck])
         sideboard_count = sum([card.quantity for card in self.sideboard])
         return maindeck_count, sideboard_count
 
 class DecklistResponse:
-    def __init__(self, success: bool = False, decklist: Decklist = None):
+    def __init__(self, success: bool = False, decklist: Decklist = None,
+                 error_message: str = None):
         self.success = success
-        self.decklist = decklist
\ No newline at end of file
+        self.decklist = decklist
+        self.error_message = error_message
\ No newline at end of file
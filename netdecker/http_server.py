@@ -0,0 +1,290 @@
+""" HTTP API for converting decklist screenshots, for clients other than the
+    Discord bot. Runs standalone with `python -m netdecker.http_server`, or
+    inside the bot process when NETDECKER_HTTP_PORT is set, in which case
+    both share the worker pool in netdecker.service.
+
+    Endpoints:
+        POST /decklist
+            Body is either raw image bytes, or JSON of the form
+            {"format": str, "image": base64 str} or
+            {"format": str, "textboxes": [{"text": str, "vertices": [...]}]}.
+            The format can also be given as a ?format= query parameter. If
+            it's left out, it's detected from the cards in the decklist.
+        POST /decklist/batch
+            Body is JSON of the form {"format": str, "items": [...]} where
+            each item has the same shape as a single /decklist JSON body, or
+            multipart/form-data with one image per part. Results are streamed
+            back as newline-delimited JSON in completion order, each tagged
+            with the index of its item.
+        GET /stats
+            Reports runtime metrics, such as the alias table size and hit rate.
+
+    Both decklist endpoints accept ?output=json (the default) or ?output=arena
+    to get the importable text list instead of the structured decklist. The
+    deck construction issues found in validation are part of the JSON
+    decklist; with arena output they're in an "issues" field of each batch
+    result, and in the X-Decklist-Issues header of a single response.
+"""
+import asyncio
+import base64
+import binascii
+import json
+import logging
+import os
+from aiohttp import web
+from netdecker import service
+from netdecker.cardfile_data import formats
+from netdecker.decklist_storage import DecklistResponse
+from netdecker.text_storage import Textbox
+
+# There's no authentication, and every request can spend OCR quota and teach
+# the card database new aliases, so only local clients are served unless
+# another interface is chosen explicitly.
+HOST = os.getenv("NETDECKER_HTTP_HOST", "127.0.0.1")
+PORT = int(os.getenv("NETDECKER_HTTP_PORT", "8080"))
+
+# The maximum number of decklists being processed at once across all requests.
+MAX_CONCURRENCY = int(os.getenv("NETDECKER_MAX_CONCURRENCY", "4"))
+
+# The maximum size of a request body in bytes. Applies to the whole batch.
+MAX_REQUEST_BYTES = int(os.getenv("NETDECKER_MAX_REQUEST_BYTES", str(20 * 1024 ** 2)))
+
+# The maximum number of items accepted in a single batch request.
+MAX_BATCH_ITEMS = int(os.getenv("NETDECKER_MAX_BATCH_ITEMS", "100"))
+
+OUTPUT_TYPES = ("json", "arena")
+
+# Carries the decklist's validation issues, as a JSON list, alongside a
+# plain text arena response.
+ISSUES_HEADER = "X-Decklist-Issues"
+
+
+class RequestError(Exception):
+    """ Raised when a request body can't be turned into a decklist job. """
+    status = 400
+
+
+class RequestTooLarge(RequestError):
+    """ Raised when a streamed request body passes MAX_REQUEST_BYTES. """
+    status = 413
+
+
+class DecklistJob:
+    """ A single unit of work: either image bytes for the OCR, or textboxes
+        that were already OCR'd elsewhere.
+    """
+    def __init__(self, format: str, image: bytes = None, textboxes=None):
+        self.format = format
+        self.image = image
+        self.textboxes = textboxes
+
+    @classmethod
+    def init_from_dict(cls, data: dict, default_format: str = None):
+        if not isinstance(data, dict):
+            raise RequestError("Each item must be a JSON object.")
+        format = parse_format(data.get("format") or default_format)
+        if "textboxes" in data:
+            try:
+                textboxes = [Textbox.init_from_dict(t) for t in data["textboxes"]]
+            except (KeyError, TypeError, ValueError):
+                raise RequestError("Malformed textboxes.")
+            return cls(format, textboxes=textboxes)
+        if "image" in data:
+            try:
+                image = base64.b64decode(data["image"], validate=True)
+            except (binascii.Error, TypeError, ValueError):
+                raise RequestError("Image must be base64 encoded.")
+            return cls(format, image=image)
+        raise RequestError("Each item needs an image or textboxes.")
+
+    async def run(self) -> DecklistResponse:
+        if self.textboxes is not None:
+            return await service.parse_textboxes(self.textboxes, self.format)
+        return await service.generate_decklist(self.image, self.format)
+
+
+def parse_format(format) -> str:
+    # Without a format, detect it from the cards in the decklist.
+    if not format:
+        return formats.AUTO
+    if not isinstance(format, str) or not formats.validate_format(format):
+        raise RequestError("Invalid format specified. Options are %s"
+                           % formats.serialize())
+    return formats.parse_format(format)
+
+
+def parse_output(request: web.Request) -> str:
+    output = request.query.get("output", "json").lower()
+    if output not in OUTPUT_TYPES:
+        raise RequestError("Invalid output specified. Options are %s"
+                           % ", ".join(OUTPUT_TYPES))
+    return output
+
+
+def serialize_response(response: DecklistResponse, job: DecklistJob,
+                       output: str) -> dict:
+    result = {"success": response.success, "format": job.format}
+    if not response.success:
+        result["error"] = response.error_message or "Unable to read the image."
+        return result
+
+    result["format"] = response.decklist.format
+    if output == "arena":
+        result["decklist"] = response.decklist.serialize()
+        result["issues"] = response.decklist.issues
+    else:
+        result["decklist"] = response.decklist.to_dict()
+    return result
+
+
+async def run_job(request: web.Request, job: DecklistJob) -> DecklistResponse:
+    async with request.app["semaphore"]:
+        return await job.run()
+
+
+async def handle_decklist(request: web.Request) -> web.StreamResponse:
+    try:
+        output = parse_output(request)
+        if request.content_type == "application/json":
+            try:
+                data = await request.json()
+            except ValueError:
+                # Covers both malformed JSON and a body that isn't UTF-8.
+                raise RequestError("Request body is not valid JSON.")
+            job = DecklistJob.init_from_dict(data, request.query.get("format"))
+        else:
+            job = DecklistJob(parse_format(request.query.get("format")),
+                              image=await request.read())
+            if not job.image:
+                raise RequestError("Request body is empty.")
+    except RequestError as e:
+        return web.json_response({"error": str(e)}, status=e.status)
+
+    response = await run_job(request, job)
+    if output == "arena" and response.success:
+        return web.Response(text=response.decklist.serialize(), headers={
+            ISSUES_HEADER: json.dumps(response.decklist.issues)})
+    return web.json_response(serialize_response(response, job, output),
+                             status=200 if response.success else 422)
+
+
+async def read_limited(part, total_size: int):
+    """ Reads a multipart part in chunks, raising RequestTooLarge once the
+        parts read so far add up to more than MAX_REQUEST_BYTES. aiohttp only
+        enforces client_max_size when the whole body is read at once.
+
+    Returns:
+        The part's bytes, and the new running total.
+    """
+    chunks = []
+    while True:
+        chunk = await part.read_chunk()
+        if not chunk:
+            return b"".join(chunks), total_size
+        total_size += len(chunk)
+        if total_size > MAX_REQUEST_BYTES:
+            raise RequestTooLarge("Request body is larger than %d bytes."
+                                  % MAX_REQUEST_BYTES)
+        chunks.append(chunk)
+
+
+async def read_batch_jobs(request: web.Request):
+    default_format = request.query.get("format")
+    if request.content_type == "multipart/form-data":
+        jobs = []
+        total_size = 0
+        reader = await request.multipart()
+        async for part in reader:
+            data, total_size = await read_limited(part, total_size)
+            if part.name == "format":
+                default_format = data.decode("utf-8", errors="replace")
+                continue
+            jobs.append(DecklistJob(parse_format(default_format), image=data))
+            if len(jobs) > MAX_BATCH_ITEMS:
+                break
+    else:
+        try:
+            data = await request.json()
+        except ValueError:
+            raise RequestError("Request body is not valid JSON.")
+        if not isinstance(data, dict) or not isinstance(data.get("items"), list):
+            raise RequestError("Batch body needs a list of items.")
+        default_format = data.get("format") or default_format
+        jobs = [DecklistJob.init_from_dict(item, default_format)
+                for item in data["items"]]
+
+    if len(jobs) == 0:
+        raise RequestError("Batch contains no items.")
+    if len(jobs) > MAX_BATCH_ITEMS:
+        raise RequestError("Batches are limited to %d items." % MAX_BATCH_ITEMS)
+    return jobs
+
+
+async def handle_batch(request: web.Request) -> web.StreamResponse:
+    try:
+        output = parse_output(request)
+        jobs = await read_batch_jobs(request)
+    except RequestError as e:
+        return web.json_response({"error": str(e)}, status=e.status)
+
+    stream = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    await stream.prepare(request)
+
+    async def run_indexed(index: int, job: DecklistJob):
+        try:
+            response = await run_job(request, job)
+        except Exception:
+            logging.exception("Batch item %d failed." % index)
+            response = DecklistResponse(False, error_message="Internal error.")
+        return index, job, response
+
+    tasks = [asyncio.ensure_future(run_indexed(i, job)) for i, job in enumerate(jobs)]
+    try:
+        for future in asyncio.as_completed(tasks):
+            index, job, response = await future
+            result = serialize_response(response, job, output)
+            result["index"] = index
+            await stream.write((json.dumps(result) + "\n").encode("utf-8"))
+    finally:
+        # If the client hangs up we don't want to keep paying for the OCR.
+        for task in tasks:
+            task.cancel()
+
+    await stream.write_eof()
+    return stream
+
+
+async def handle_stats(request: web.Request) -> web.Response:
+    return web.json_response(await service.stats())
+
+
+async def start_maintenance(app: web.Application):
+    service.start_maintenance()
+
+
+def create_app() -> web.Application:
+    app = web.Application(client_max_size=MAX_REQUEST_BYTES)
+    app["semaphore"] = asyncio.Semaphore(MAX_CONCURRENCY)
+    app.router.add_post("/decklist", handle_decklist)
+    app.router.add_post("/decklist/batch", handle_batch)
+    app.router.add_get("/stats", handle_stats)
+    return app
+
+
+async def start_site(host: str = HOST, port: int = PORT) -> web.AppRunner:
+    """ Starts the server on the running event loop, for use alongside
+        another asyncio application such as the Discord bot. Alias
+        maintenance is left to the caller, since it's shared by the process.
+    """
+    runner = web.AppRunner(create_app())
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info("HTTP server listening on %s:%d" % (host, port))
+    return runner
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    app = create_app()
+    app.on_startup.append(start_maintenance)
+    web.run_app(app, host=HOST, port=PORT)
@@ -0,0 +1,192 @@
+""" Opt-in profiling of individual parses, for working out why one particular
+    screenshot was slow. A captured parse is run under cProfile and
+    tracemalloc, and the stats are written to their own directory in
+    PROFILE_DIR along with the OCR textboxes, so the exact case can be
+    replayed offline with `python -m netdecker.profiling CAPTURE_DIR`.
+
+    Capturing is enabled by setting NETDECKER_PROFILE_RATE to the fraction of
+    parses to capture (1 captures every parse), or at runtime through
+    set_sample_rate and capture_next (used by the bot's !profile command).
+    When it's disabled the parser only pays for a single attribute check.
+"""
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import shutil
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+
+PROFILE_DIR = os.getenv("NETDECKER_PROFILE_DIR", "profiles")
+
+# The maximum number of captures kept on disk. The oldest are deleted first.
+MAX_CAPTURES = int(os.getenv("NETDECKER_PROFILE_MAX", "50"))
+
+# The number of functions and allocation sites written to each capture.
+TOP_STATS = 40
+
+sample_rate = float(os.getenv("NETDECKER_PROFILE_RATE", "0"))
+pending_captures = 0
+
+# Checked by the parser before anything else in this module is touched.
+active = sample_rate > 0
+
+# tracemalloc is process-wide, so only one parse is captured at a time.
+_capture_lock = threading.Lock()
+
+# Guards pending_captures, which parses on the worker threads count down.
+_claim_lock = threading.Lock()
+
+
+def _update_active():
+    global active
+    active = sample_rate > 0 or pending_captures > 0
+
+
+def set_sample_rate(rate: float):
+    """ Sets the fraction of parses to capture, between 0 and 1. """
+    global sample_rate
+    sample_rate = min(max(rate, 0.0), 1.0)
+    _update_active()
+
+
+def capture_next(count: int = 1):
+    """ Captures the next `count` parses regardless of the sample rate. """
+    global pending_captures
+    with _claim_lock:
+        pending_captures += max(count, 0)
+        _update_active()
+
+
+def disable():
+    """ Stops all capturing, including any requested with capture_next. """
+    global sample_rate, pending_captures
+    with _claim_lock:
+        sample_rate = 0.0
+        pending_captures = 0
+        _update_active()
+
+
+def _claim_capture() -> bool:
+    global pending_captures
+    with _claim_lock:
+        if pending_captures > 0:
+            pending_captures -= 1
+            _update_active()
+            return True
+    return random.random() < sample_rate
+
+
+def profile_parse(parse, textboxes, format: str):
+    """ Calls parse(textboxes, format), capturing it if it's sampled.
+        Parses that overlap a capture already in progress run as normal
+        without using up a requested capture, as do parses that aren't
+        sampled.
+    """
+    if not _capture_lock.acquire(blocking=False):
+        return parse(textboxes, format)
+    if not _claim_capture():
+        _capture_lock.release()
+        return parse(textboxes, format)
+
+    try:
+        payload = {"format": format,
+                   "textboxes": [textbox.to_dict() for textbox in textboxes]}
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            result = profiler.runcall(parse, textboxes, format)
+        finally:
+            duration = time.perf_counter() - start
+            snapshot = tracemalloc.take_snapshot()
+            if started_tracing:
+                tracemalloc.stop()
+        try:
+            capture_dir = write_capture(profiler, snapshot, payload, duration)
+            logging.info("Wrote parse profile to %s (%.3fs)" % (capture_dir, duration))
+        except OSError:
+            logging.exception("Unable to write parse profile.")
+        return result
+    finally:
+        _capture_lock.release()
+
+
+def write_capture(profiler: cProfile.Profile, snapshot: tracemalloc.Snapshot,
+                  payload: dict, duration: float) -> str:
+    name = "%s-%s-%s" % (datetime.now().strftime("%Y%m%d-%H%M%S-%f"),
+                         payload["format"], uuid.uuid4().hex[:6])
+    capture_dir = os.path.join(PROFILE_DIR, name)
+    os.makedirs(capture_dir)
+
+    profiler.dump_stats(os.path.join(capture_dir, "profile.pstats"))
+    stats_text = io.StringIO()
+    pstats.Stats(profiler, stream=stats_text).sort_stats("cumulative").print_stats(TOP_STATS)
+    with open(os.path.join(capture_dir, "profile.txt"), "w", encoding="utf-8") as f:
+        f.write("Parse took %.3fs\n" % duration)
+        f.write(stats_text.getvalue())
+
+    with open(os.path.join(capture_dir, "allocations.txt"), "w", encoding="utf-8") as f:
+        for stat in snapshot.statistics("lineno")[:TOP_STATS]:
+            f.write("%s\n" % stat)
+
+    with open(os.path.join(capture_dir, "textboxes.json"), "w", encoding="utf-8") as f:
+        json.dump(payload, f)
+
+    prune_captures()
+    return capture_dir
+
+
+def prune_captures():
+    """ Deletes the oldest captures beyond MAX_CAPTURES. Capture names start
+        with a timestamp, so sorting by name sorts by age.
+    """
+    captures = sorted(name for name in os.listdir(PROFILE_DIR)
+                      if os.path.isdir(os.path.join(PROFILE_DIR, name)))
+    for name in captures[:max(len(captures) - MAX_CAPTURES, 0)]:
+        shutil.rmtree(os.path.join(PROFILE_DIR, name), ignore_errors=True)
+
+
+def load_capture(capture_dir: str):
+    """ Returns the textboxes and format recorded in a capture. """
+    from netdecker.text_storage import Textbox
+    with open(os.path.join(capture_dir, "textboxes.json"), "r", encoding="utf-8") as f:
+        payload = json.load(f)
+    textboxes = [Textbox.init_from_dict(t) for t in payload["textboxes"]]
+    return textboxes, payload["format"]
+
+
+def replay(capture_dir: str):
+    """ Reruns a captured parse under cProfile and prints the stats. The
+        parse skips the sampling hook, so it never writes (or prunes)
+        captures itself, and alias learning is turned off so that every
+        replay of a capture sees the same database.
+    """
+    from netdecker import decklist_parser
+    from netdecker.cardfile_data import cardfile
+    textboxes, format = load_capture(capture_dir)
+    profiler = cProfile.Profile()
+    learning = cardfile.learning
+    cardfile.learning = False
+    try:
+        decklist = profiler.runcall(decklist_parser._parse_textboxes, textboxes, format)
+    finally:
+        cardfile.learning = learning
+    print(decklist.serialize())
+    pstats.Stats(profiler).sort_stats("cumulative").print_stats(TOP_STATS)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python -m netdecker.profiling CAPTURE_DIR")
+        sys.exit(1)
+    replay(sys.argv[1])
@@ -0,0 +1,94 @@
+""" Shared runtime for the long-running entry points (the Discord bot and the
+    HTTP server). Both hand their decklist work to the same worker pool so
+    the blocking OCR and parsing calls never stall the event loop, and so
+    running both in one process shares a single pool and card database.
+"""
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from netdecker import decklist_parser, ocr
+from netdecker.cardfile_data import card_index, cardfile
+from netdecker.decklist_storage import DecklistResponse
+from netdecker.text_storage import Textbox
+
+# The number of worker threads available for OCR and parsing. The OCR is a
+# network call, so this can comfortably exceed the number of cores.
+WORKER_COUNT = int(os.getenv("NETDECKER_WORKERS", "8"))
+
+# The number of learned (non-canonical) card aliases kept by compaction, and
+# how often compaction runs, in seconds.
+ALIAS_CAP = int(os.getenv("NETDECKER_ALIAS_CAP", "20000"))
+ALIAS_COMPACT_INTERVAL = int(os.getenv("NETDECKER_ALIAS_COMPACT_INTERVAL", "3600"))
+
+executor = ThreadPoolExecutor(max_workers=WORKER_COUNT,
+                              thread_name_prefix="netdecker")
+
+recognizer = ocr.GoogleOCR()
+
+_maintenance_task = None
+_maintenance_event_loop = None
+
+
+async def generate_decklist(img_b64, format: str) -> DecklistResponse:
+    """ Runs the full OCR and parse for an image on the shared worker pool.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor, decklist_parser.generate_decklist, img_b64, recognizer, format)
+
+
+async def parse_textboxes(textboxes: List[Textbox], format: str) -> DecklistResponse:
+    """ Parses textboxes that were already run through an OCR on the shared
+        worker pool.
+    """
+    loop = asyncio.get_running_loop()
+    decklist = await loop.run_in_executor(
+        executor, decklist_parser.parse_textboxes, textboxes, format)
+    return DecklistResponse(True, decklist)
+
+
+def compact_aliases() -> dict:
+    """ Trims the learned aliases down to ALIAS_CAP and returns the alias
+        table stats afterwards.
+    """
+    evicted = cardfile.compact_aliases(ALIAS_CAP)
+    stats = cardfile.alias_stats()
+    stats["evicted"] = evicted
+    logging.info("Alias compaction: %s" % stats)
+    return stats
+
+
+async def _maintenance_loop():
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(executor, compact_aliases)
+        except Exception:
+            logging.exception("Alias compaction failed.")
+        await asyncio.sleep(ALIAS_COMPACT_INTERVAL)
+
+
+def start_maintenance():
+    """ Starts the periodic alias compaction on the running event loop. Safe
+        to call from both the bot and the HTTP server in the same process,
+        and starts it again if the loop it was running on has finished.
+    """
+    global _maintenance_task, _maintenance_event_loop
+    loop = asyncio.get_running_loop()
+    if _maintenance_task is None or _maintenance_task.done() \
+            or _maintenance_event_loop is not loop:
+        _maintenance_task = loop.create_task(_maintenance_loop())
+        _maintenance_event_loop = loop
+
+
+def _collect_stats() -> dict:
+    return {"alias": cardfile.alias_stats(),
+            "confusion": card_index.confusion_stats()}
+
+
+async def stats() -> dict:
+    """ Reports the runtime metrics, grouped by component. """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, _collect_stats)
@@ -61,6 +61,26 @@ class BoundingBox:
                             bounding_poly.vertices[3].y)
         return cls(upper_left, upper_right, lower_right, lower_left)
 
+    @classmethod
+    def init_from_dict(cls, vertices: list):
+        """Creates a BoundingBox from a JSON-style list of vertices.
+            Args:
+                vertices (list): Four {"x": int, "y": int} dicts in clockwise
+                order from the upper left vertex, the same layout as
+                BoundingPoly.vertices.
+
+            Returns:
+                BoundingBox: The instantiated BoundingBox object.
+        """
+        if len(vertices) != 4:
+            raise ValueError("A bounding box needs exactly 4 vertices.")
+        return cls(*[Vertex(int(v["x"]), int(v["y"])) for v in vertices])
+
+    def to_dict(self) -> list:
+        return [{"x": v.x, "y": v.y} for v in
+                (self.upper_left_vertex, self.upper_right_vertex,
+                 self.lower_right_vertex, self.lower_left_vertex)]
+
     def get_height(self):
         return self.lower_left_vertex.y - self.upper_left_vertex.y
 
@@ -90,6 +110,18 @@ class Textbox:
         self.bounding_box = bounding_box
         self.text = text
 
+    @classmethod
+    def init_from_dict(cls, data: dict):
+        """ Creates a Textbox from its JSON form, {"text": str,
+            "vertices": [...]}. Used to accept textboxes that were already
+            run through an OCR elsewhere.
+        """
+        return cls(BoundingBox.init_from_dict(data["vertices"]),
+                   str(data["text"]))
+
+    def to_dict(self) -> dict:
+        return {"text": self.text, "vertices": self.bounding_box.to_dict()}
+
     def addWord(self, bounding_box, text):
         if not self.bounding_box:
             self.bounding_box = bounding_box
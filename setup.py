@@ -23,6 +23,9 @@ setuptools.setup(
     packages=setuptools.find_packages(),
     package_data={'' : ['cardfile_data/cards.db']},
     python_requires=">=3.6",
+    entry_points={
+        'console_scripts': ['netdecker-batch=netdecker.batch:main'],
+    },
     install_requires=[
         'google-cloud-vision',
         'python-Levenshtein'
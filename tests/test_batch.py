@@ -0,0 +1,76 @@
+import pytest
+from netdecker import batch
+from netdecker.decklist_storage import CardTuple, Decklist
+from netdecker.ocr import OCR, OCRResponse
+
+class EmptyOCR(OCR):
+    def detect_text_uri(self, b64_img):
+        return OCRResponse(b64_img != b"bad", [], "unreadable")
+
+def test_plan_items():
+    items = batch.plan_items(["/a/deck.png", "/b/deck.png", "/b/other.jpg"])
+    assert [item.output_name for item in items] == \
+           ["deck.txt", "deck-2.txt", "other.txt"]
+
+def test_discover_and_resume(tmp_path):
+    images = tmp_path / "images"
+    images.mkdir()
+    (images / "one.png").write_bytes(b"one")
+    (images / "two.png").write_bytes(b"bad")
+    (images / "notes.txt").write_text("not an image")
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text("# comment\nimages/one.png\n\nimages/two.png\n")
+
+    paths = batch.discover_images(str(images))
+    assert [p.split("/")[-1] for p in paths] == ["one.png", "two.png"]
+    assert batch.discover_images(str(manifest)) == paths
+
+    output = tmp_path / "out"
+    results = batch.run_batch(batch.plan_items(paths), "standard", str(output),
+                              processes=1, ocr_concurrency=2, recognizer=EmptyOCR())
+    assert sorted(r.success for r in results) == [False, True]
+    assert (output / "one.txt").read_text() == "Deck\n"
+    assert not (output / "two.txt").exists()
+
+    # A torn final line from an interrupted run is ignored.
+    with open(output / batch.JOURNAL_NAME, "a") as f:
+        f.write('{"image": ')
+    journal = batch.load_journal(str(output / batch.JOURNAL_NAME))
+    assert journal[paths[0]]["status"] == "done"
+    assert journal[paths[0]]["format"] == "standard"
+    assert journal[paths[0]]["format_error"] is None
+    assert journal[paths[1]]["status"] == "failed"
+
+    results = batch.run_batch(batch.plan_items(paths[1:]), "standard", str(output),
+                              processes=1, ocr_concurrency=1, recognizer=EmptyOCR())
+    journal = batch.load_journal(str(output / batch.JOURNAL_NAME))
+    assert len(journal) == 2
+
+def test_interrupt_stops_submitting(tmp_path, monkeypatch):
+    class CountingOCR(EmptyOCR):
+        calls = 0
+        def detect_text_uri(self, b64_img):
+            CountingOCR.calls += 1
+            return super().detect_text_uri(b64_img)
+
+    def interrupt(output_dir, result):
+        raise KeyboardInterrupt
+    monkeypatch.setattr(batch, "write_output", interrupt)
+
+    paths = []
+    for i in range(20):
+        path = tmp_path / ("%d.png" % i)
+        path.write_bytes(b"deck")
+        paths.append(str(path))
+    with pytest.raises(KeyboardInterrupt):
+        batch.run_batch(batch.plan_items(paths), "standard", str(tmp_path / "out"),
+                        processes=1, ocr_concurrency=2, recognizer=CountingOCR())
+    assert CountingOCR.calls <= 2
+
+def test_missing_format_reason():
+    decklist = Decklist()
+    assert batch.describe_missing_format(decklist) == "No cards were recognized."
+    decklist.maindeck.append(CardTuple("Opt", None, 4))
+    assert "any one format" in batch.describe_missing_format(decklist)
+    decklist.format = "modern"
+    assert batch.describe_missing_format(decklist) is None
@@ -0,0 +1,52 @@
+import sqlite3 as sl
+import pytest
+from netdecker.cardfile_data import cardfile
+
+@pytest.fixture
+def alias_db(tmp_path, monkeypatch):
+    # A database from before hit tracking, to check the schema upgrade too.
+    path = str(tmp_path / "cards.db")
+    con = sl.connect(path)
+    with con:
+        con.execute("CREATE TABLE CARD_ALIAS (alias TEXT PRIMARY KEY, name TEXT NOT NULL)")
+        con.execute("CREATE TABLE CARD_LEGALITIES (name TEXT NOT NULL, format TEXT NOT NULL)")
+        con.executemany("INSERT INTO CARD_ALIAS VALUES (?, ?)",
+                        [("Opt", "Opt"), ("Negate", "Negate")])
+        con.executemany("INSERT INTO CARD_LEGALITIES VALUES (?, ?)",
+                        [("Opt", "pioneer"), ("Negate", "pioneer")])
+    monkeypatch.setattr(cardfile, "DATABASE_PATH", path)
+    return path
+
+def test_alias_compaction(alias_db):
+    cardfile.add_alias("0pt", "Opt")
+    cardfile.add_alias("Opt U", "Opt")
+    cardfile.add_alias("Negatc", "Negate")
+
+    assert cardfile.name_from_alias("Nega", None, True) == "Negate"
+    assert cardfile.name_from_alias("opt u", "pioneer", False) == "Opt"
+    assert cardfile.name_from_alias("Negatc", "modern", False) is None
+
+    # 0pt has only its first hit. The other two tie on hits, so the less
+    # recently used one goes.
+    assert cardfile.compact_aliases(1) == 2
+    stats = cardfile.alias_stats()
+    assert stats["canonical"] == 2
+    assert stats["learned"] == 1
+
+    con = sl.connect(alias_db)
+    remaining = con.execute("SELECT alias, hits FROM CARD_ALIAS WHERE alias != name").fetchall()
+    assert remaining == [("Opt U", 2)]
+
+    assert cardfile.compact_aliases(0) == 1
+    assert cardfile.alias_stats()["aliases"] == 2
+
+def test_new_aliases_outlive_stale_ones(alias_db):
+    cardfile.add_alias("0pt", "Opt")
+    con = sl.connect(alias_db)
+    with con:
+        con.execute("UPDATE CARD_ALIAS SET last_used = last_used - 300 * 86400 WHERE alias = '0pt'")
+    cardfile.add_alias("Negatc", "Negate")
+
+    assert cardfile.compact_aliases(1) == 1
+    remaining = con.execute("SELECT alias FROM CARD_ALIAS WHERE alias != name").fetchall()
+    assert remaining == [("Negatc",)]
@@ -1,5 +1,7 @@
 import pytest
-from netdecker.decklist_parser import DecklistParser, Decklist
+from netdecker.decklist_parser import DecklistParser, Decklist, parse_textboxes
+from netdecker.text_storage import BoundingBox, Textbox, Vertex
+from netdecker.cardfile_data import card_index, formats
 
 def test_truncation_check():
     d = DecklistParser([], "historic")
@@ -15,4 +17,37 @@ def test_line_matching():
     str2 = "nonland..."
     assert d.match_to_card_name(str1) == "Teachings of the Archaics"
     assert not d.match_to_card_name(str2)
-    
\ No newline at end of file
+
+def test_format_detection():
+    def textbox(text, y):
+        return Textbox(BoundingBox(Vertex(0, y), Vertex(100, y),
+                                   Vertex(100, y + 10), Vertex(0, y + 10)), text)
+
+    textboxes = [textbox("Opt", 0), textbox("Lightning Bolt", 20),
+                 textbox("Brainstorm", 40)]
+    assert parse_textboxes(textboxes, "auto").format == "pauper"
+    assert parse_textboxes(textboxes, "legacy").format == "legacy"
+    assert parse_textboxes([], "auto").format is None
+
+def test_format_masks():
+    mask = formats.format_bit("standard") | formats.format_bit("pauper")
+    assert formats.formats_in_mask(mask) == ["standard", "pauper"]
+    assert formats.validate_format("Auto")
+
+def test_confusion_keys():
+    assert card_index.canonical_key("Sheoldred, the ApocaIypse") == \
+           card_index.canonical_key("Sheoldred, the Apocalypse")
+    assert card_index.canonical_key("Rnountain") == card_index.canonical_key("Mountain")
+    assert card_index.canonical_key("Bear Cub") != card_index.canonical_key("Bear")
+    assert card_index.confusion_match("Sheoldred the ApocaIypse B", None) == \
+           "Sheoldred, the Apocalypse"
+
+    d = DecklistParser([], "modern")
+    assert d.preprocess_line_text("Lightning Bo1t") == "Lightning Bolt"
+    assert d.match_to_card_name("Lightnlng BoIt") == "Lightning Bolt"
+
+def test_confusion_keeps_short_last_words():
+    # Trailing mana is only stripped from OCR lines, not from card names.
+    assert card_index.confusion_match("Bear", "legacy") is None
+    assert card_index.confusion_match("Bear Cub", "legacy") == "Bear Cub"
+    assert card_index.confusion_match("Bear Cub G", "legacy") == "Bear Cub"
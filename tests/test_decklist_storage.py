@@ -1,2 +1,82 @@
+import sqlite3 as sl
 import pytest
-from netdecker.decklist_storage import Decklist
\ No newline at end of file
+from netdecker.cardfile_data import card_index, cardfile
+from netdecker.decklist_storage import Decklist, CardTuple
+
+LEGALITIES = [("Island", "standard"), ("Island", "vintage"),
+              ("Lightning Bolt", "vintage"), ("Ancestral Recall", "vintage")]
+
+def make_card_db(tmp_path, monkeypatch, old_schema: bool):
+    path = str(tmp_path / "cards.db")
+    con = sl.connect(path)
+    with con:
+        if old_schema:
+            con.execute("CREATE TABLE CARD_OBJECT (scryfall_id TEXT, name TEXT, companion INTEGER)")
+            con.execute("CREATE TABLE CARD_LEGALITIES (name TEXT, format TEXT)")
+            con.executemany("INSERT INTO CARD_LEGALITIES VALUES (?, ?)", LEGALITIES)
+        else:
+            con.execute("CREATE TABLE CARD_OBJECT (scryfall_id TEXT, name TEXT, companion INTEGER, "
+                        "basic_land INTEGER, copy_limit INTEGER)")
+            con.execute("CREATE TABLE CARD_LEGALITIES (name TEXT, format TEXT, restricted INTEGER)")
+            con.executemany("INSERT INTO CARD_LEGALITIES VALUES (?, ?, ?)",
+                            [(name, format, name == "Ancestral Recall")
+                             for name, format in LEGALITIES])
+        for i, name in enumerate(["Island", "Lightning Bolt", "Ancestral Recall"]):
+            row = (str(i), name, 0) if old_schema else \
+                  (str(i), name, 0, name == "Island", None if name == "Island" else 4)
+            con.execute("INSERT INTO CARD_OBJECT VALUES (%s)" % ", ".join("?" * len(row)), row)
+    monkeypatch.setattr(cardfile, "DATABASE_PATH", path)
+    # The index is cached per process, so load it fresh from this database.
+    monkeypatch.setattr(card_index, "_metadata", None)
+    monkeypatch.setattr(card_index, "_legality_masks", None)
+    monkeypatch.setattr(card_index, "_format_sizes", None)
+    monkeypatch.setattr(card_index, "_confusion_indexes", {})
+
+def make_decklist() -> Decklist:
+    d = Decklist()
+    d.format = "vintage"
+    d.maindeck.append(CardTuple("Island", None, 50))
+    d.maindeck.append(CardTuple("Lightning Bolt", None, 4))
+    d.maindeck.append(CardTuple("Ancestral Recall", None, 2))
+    d.sideboard.append(CardTuple("Lightning Bolt", None, 1))
+    return d
+
+def test_decklist_to_dict():
+    d = Decklist()
+    d.maindeck.append(CardTuple("Opt", None, 4))
+    d.sideboard.append(CardTuple("Negate", None, 2))
+
+    assert d.to_dict() == {
+        "format": None,
+        "issues": [],
+        "companion": None,
+        "maindeck": [{"name": "Opt", "quantity": 4}],
+        "sideboard": [{"name": "Negate", "quantity": 2}],
+    }
+
+def test_validate(tmp_path, monkeypatch):
+    make_card_db(tmp_path, monkeypatch, old_schema=False)
+    d = make_decklist()
+    d.validate()
+    assert d.issues == [
+        "Lightning Bolt has 5 copies, the limit is 4.",
+        "Ancestral Recall has 2 copies, the limit is 1.",
+        "Maindeck has 56 cards, the minimum is 60.",
+    ]
+
+    d.format = "standard"
+    d.validate()
+    assert "Lightning Bolt is not legal in standard." in d.issues
+    assert "Island is not legal in standard." not in d.issues
+
+def test_validate_old_schema(tmp_path, monkeypatch, caplog):
+    # Databases built before copy limits were recorded fall back to the
+    # known basic land names, and can't tell which cards are restricted.
+    make_card_db(tmp_path, monkeypatch, old_schema=True)
+    d = make_decklist()
+    d.validate()
+    assert d.issues == [
+        "Lightning Bolt has 5 copies, the limit is 4.",
+        "Maindeck has 56 cards, the minimum is 60.",
+    ]
+    assert "no restricted column" in caplog.text
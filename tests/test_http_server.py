@@ -0,0 +1,74 @@
+import asyncio
+import json
+import pytest
+from aiohttp import FormData
+from aiohttp.test_utils import TestClient, TestServer
+from netdecker import http_server, service
+
+def post_batch(form):
+    async def run():
+        async with TestClient(TestServer(http_server.create_app())) as client:
+            response = await client.post("/decklist/batch", data=form)
+            return response.status, await response.json()
+    return asyncio.run(run())
+
+def test_multipart_size_limit(monkeypatch):
+    monkeypatch.setattr(http_server, "MAX_REQUEST_BYTES", 1000)
+
+    form = FormData()
+    form.add_field("format", "standard")
+    for i in range(3):
+        form.add_field("image", b"x" * 400, filename="deck%d.png" % i,
+                       content_type="image/png")
+    status, body = post_batch(form)
+    assert status == 413
+    assert "1000 bytes" in body["error"]
+
+def test_multipart_bad_format():
+    form = FormData()
+    form.add_field("format", "nonsense")
+    form.add_field("image", b"x", filename="deck.png", content_type="image/png")
+    status, body = post_batch(form)
+    assert status == 400
+
+def test_arena_output_keeps_issues():
+    async def run():
+        async with TestClient(TestServer(http_server.create_app())) as client:
+            single = await client.post("/decklist?format=standard&output=arena",
+                                       json={"textboxes": []})
+            batch = await client.post("/decklist/batch?output=arena",
+                                      json={"format": "standard",
+                                            "items": [{"textboxes": []}]})
+            return (await single.text(), single.headers[http_server.ISSUES_HEADER],
+                    json.loads(await batch.text()))
+    text, header, result = asyncio.run(run())
+
+    issues = ["Maindeck has 0 cards, the minimum is 60."]
+    assert text == "Deck\n"
+    assert json.loads(header) == issues
+    assert result["decklist"] == "Deck\n"
+    assert result["issues"] == issues
+
+def test_batch_rejects_raw_image():
+    async def run():
+        async with TestClient(TestServer(http_server.create_app())) as client:
+            response = await client.post("/decklist/batch", data=b"\x89PNG\r\n\x1a\n\xff",
+                                         headers={"Content-Type": "image/png"})
+            return response.status, await response.json()
+    status, body = asyncio.run(run())
+    assert status == 400
+    assert "not valid JSON" in body["error"]
+
+def test_maintenance_restarts_on_new_loop(monkeypatch):
+    runs = []
+    async def fake_loop():
+        runs.append(asyncio.get_running_loop())
+    monkeypatch.setattr(service, "_maintenance_loop", fake_loop)
+    monkeypatch.setattr(service, "_maintenance_task", None)
+
+    async def start():
+        service.start_maintenance()
+        await asyncio.sleep(0)
+    asyncio.run(start())
+    asyncio.run(start())
+    assert len(runs) == 2
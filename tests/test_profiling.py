@@ -0,0 +1,62 @@
+import os
+import pytest
+from netdecker import decklist_parser, profiling
+from netdecker.cardfile_data import cardfile
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "MAX_CAPTURES", 2)
+    yield tmp_path
+    profiling.disable()
+
+def test_capture_and_replay(profile_dir):
+    assert not profiling.active
+    profiling.capture_next(3)
+    assert profiling.active
+
+    for _ in range(3):
+        decklist = decklist_parser.parse_textboxes([], "standard")
+        assert decklist.serialize() == "Deck\n"
+    assert not profiling.active
+
+    captures = sorted(os.listdir(profile_dir))
+    assert len(captures) == 2
+    capture_dir = os.path.join(profile_dir, captures[-1])
+    for name in ("profile.txt", "profile.pstats", "allocations.txt", "textboxes.json"):
+        assert os.path.exists(os.path.join(capture_dir, name))
+
+    textboxes, format = profiling.load_capture(capture_dir)
+    assert textboxes == [] and format == "standard"
+
+def test_disabled(profile_dir):
+    profiling.set_sample_rate(0)
+    decklist_parser.parse_textboxes([], "standard")
+    assert os.listdir(profile_dir) == []
+
+def test_overlapping_parse_keeps_claim(profile_dir):
+    profiling.capture_next(1)
+    # Simulate another parse in the middle of a capture.
+    with profiling._capture_lock:
+        decklist_parser.parse_textboxes([], "standard")
+    assert profiling.pending_captures == 1
+
+    decklist_parser.parse_textboxes([], "standard")
+    assert profiling.pending_captures == 0
+    assert len(os.listdir(profile_dir)) == 1
+
+def test_replay_leaves_captures_and_aliases_alone(profile_dir, monkeypatch, capsys):
+    profiling.capture_next(1)
+    decklist_parser.parse_textboxes([], "standard")
+    [capture] = os.listdir(profile_dir)
+
+    added = []
+    monkeypatch.setattr(cardfile, "ensure_alias_schema", lambda: added.append(True))
+    profiling.set_sample_rate(1)
+    profiling.replay(os.path.join(profile_dir, capture))
+    assert os.listdir(profile_dir) == [capture]
+    assert cardfile.learning
+
+    monkeypatch.setattr(cardfile, "learning", False)
+    cardfile.add_alias("0pt", "Opt")
+    assert added == []
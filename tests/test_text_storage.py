@@ -69,6 +69,14 @@ def test_textbox(left_box, right_box):
     assert t1.bounding_box.upper_left_vertex.x == 0
     assert t1.bounding_box.lower_left_vertex.x == 0
 
+def test_textbox_dict_round_trip(left_box):
+    t1 = Textbox(left_box, "Opt")
+    t2 = Textbox.init_from_dict(t1.to_dict())
 
+    assert t2.text == "Opt"
+    assert t2.bounding_box.serialize() == left_box.serialize()
+    assert t2.bounding_box.upper_right_vertex.x == 3
+    assert t2.bounding_box.lower_left_vertex.y == 2
 
-
+    with pytest.raises(ValueError):
+        BoundingBox.init_from_dict([{"x": 0, "y": 0}])